@@ -4,11 +4,42 @@ import sys
 import re
 import yaml
 from pathlib import Path
-from collections import OrderedDict
-from typing import Dict, List, Optional, Union, Any
+from typing import Dict, Iterable, Iterator, List, Optional, Union, Any
 from dataclasses import dataclass
 import json
 import shlex
+import hashlib
+import tempfile
+
+# Dockerfileの命令名（大文字で書かれた命令は変換せずにそのまま照合する）
+_DIRECTIVES = frozenset((
+    'FROM', 'RUN', 'CMD', 'LABEL', 'MAINTAINER', 'EXPOSE', 'ENV', 'ADD', 'COPY',
+    'ENTRYPOINT', 'VOLUME', 'USER', 'WORKDIR', 'ARG', 'ONBUILD', 'STOPSIGNAL',
+    'HEALTHCHECK', 'SHELL',
+))
+
+# 命令引数の正規表現（呼び出しごとのコンパイルを避けるため事前にコンパイル）
+_FROM_RE = re.compile(r'([\w\-.:/]+)', re.ASCII)
+_EXPOSE_RE = re.compile(r'([0-9]+)(?:/(tcp|udp))?')
+
+# HEALTHCHECKの時間指定オプションとdocker-compose.ymlのキーの対応
+_HEALTHCHECK_OPTIONS = {
+    '--interval': 'interval',
+    '--timeout': 'timeout',
+    '--start-period': 'start_period',
+}
+
+# 生成結果キャッシュを無効にする環境変数と、このモジュール自体のハッシュ
+# （解析・出力処理が変わればキャッシュのキーも変わる）
+_CACHE_DISABLE_ENV = 'DOCKER_COMPOSE_GENERATOR_NO_CACHE'
+_CODE_DIGEST = hashlib.blake2b(Path(__file__).read_bytes(), digest_size=16).digest()
+_HASH_CHUNK_SIZE = 1 << 16
+
+# YAML出力用（引用符なしで書き出せる文字列の判定と、引用符付き文字列でエスケープが必要な文字）
+_PLAIN_SCALAR_RE = re.compile(r'(?!-$)[\w./-][\w./=@+-]*(?::[\w./=@+-]+)*', re.ASCII)
+_NON_PRINTABLE_RE = re.compile('[\x7f-\x9f\u2028\u2029\ufffe\uffff]')
+_YAML_RESOLVER = yaml.resolver.Resolver()
+_YAML_STR_TAG = 'tag:yaml.org,2002:str'
 
 @dataclass
 class DockerfileConfig:
@@ -58,26 +89,82 @@ class DockerfileParser:
             PermissionError: Dockerfileの読み取り権限がない場合
         """
         try:
-            with open(self.dockerfile_path, 'r') as f:
-                content = f.read()
+            f = open(self.dockerfile_path, 'r', encoding='utf-8')
         except FileNotFoundError:
             raise FileNotFoundError(f"Dockerfile not found: {self.dockerfile_path}")
         except PermissionError:
             raise PermissionError(f"Permission denied: {self.dockerfile_path}")
 
-        # 正規化
-        content = self._normalize_content(content)
+        with f:
+            self._parse_lines(f)
+
+    @classmethod
+    def parse_cached(cls, dockerfile_path: Union[str, Path], use_cache: bool = True) -> str:
+        """
+        Dockerfileを解析してdocker-compose.ymlのYAML文字列を返す
+        （内容が同じDockerfileは前回の生成結果をキャッシュから返す）
+
+        Args:
+            dockerfile_path: Dockerfileのパス
+            use_cache: キャッシュを使うかどうか（環境変数
+                DOCKER_COMPOSE_GENERATOR_NO_CACHEが設定されていれば常に使わない）
+
+        Returns:
+            str: YAML形式のdocker-compose.ymlの内容
 
-        # 各命令を抽出
-        self._extract_from(content)
-        self._extract_expose(content)
-        self._extract_volume(content)
-        self._extract_env(content)
-        self._extract_entrypoint(content)
-        self._extract_cmd(content)
-        self._extract_user(content)
-        self._extract_healthcheck(content)
-        self._extract_workdir(content)
+        Raises:
+            FileNotFoundError: Dockerfileが見つからない場合
+            PermissionError: Dockerfileの読み取り権限がない場合
+        """
+        parser = cls(dockerfile_path)
+        use_cache = use_cache and not os.environ.get(_CACHE_DISABLE_ENV)
+        if use_cache:
+            # ホームディレクトリが分からない環境ではキャッシュを使わない
+            try:
+                cache_dir = _cache_dir()
+            except (RuntimeError, KeyError):
+                use_cache = False
+        if use_cache:
+            # ファイル全体をメモリに載せないよう、一定サイズずつハッシュに渡す
+            h = hashlib.blake2b(digest_size=16)
+            try:
+                with open(parser.dockerfile_path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b''):
+                        h.update(chunk)
+            except FileNotFoundError:
+                raise FileNotFoundError(f"Dockerfile not found: {parser.dockerfile_path}")
+            except PermissionError:
+                raise PermissionError(f"Permission denied: {parser.dockerfile_path}")
+            # サービス名も出力に含まれるためキーに含める
+            h.update(_CODE_DIGEST)
+            h.update(parser._service_name().encode('utf-8'))
+            cache_path = cache_dir / f"{h.hexdigest()}.yml"
+            # 読めない・壊れたエントリは無視して生成し直す
+            try:
+                with open(cache_path, 'r', encoding='utf-8') as f:
+                    return f.read()
+            except (OSError, ValueError):
+                pass
+
+        parser.parse()
+        compose_yaml = parser.generate_compose_yaml()
+        if not use_cache:
+            return compose_yaml
+
+        # キャッシュへの書き込みに失敗しても生成結果はそのまま返す
+        try:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    f.write(compose_yaml)
+                os.replace(tmp_path, cache_path)
+            except OSError:
+                os.unlink(tmp_path)
+                raise
+        except OSError:
+            pass
+        return compose_yaml
 
     def generate_compose(self, service_name: str) -> Dict[str, Any]:
         """
@@ -130,65 +217,152 @@ class DockerfileParser:
         Returns:
             str: YAML形式のdocker-compose.ymlの内容
         """
+        compose = self.generate_compose(self._service_name())
+        return self._emit_compose(compose)
+
+    def _service_name(self) -> str:
+        """
+        Dockerfileのディレクトリ名からサービス名を決定する
+
+        Returns:
+            str: サービス名
+        """
         service_name = self.dockerfile_path.parent.name.lower()
         if not service_name or service_name == '.':
             service_name = 'app'
-        compose = self.generate_compose(service_name)
-        return yaml.safe_dump(self._to_dict(compose), default_flow_style=False, sort_keys=False)
+        return service_name
 
-    def _to_dict(self, obj: Any) -> Any:
+    def _emit_compose(self, compose: Dict[str, Any]) -> str:
         """
-        オブジェクトを辞書に変換する
-        
+        docker-compose.ymlの内容をYAML文字列に変換する
+
         Args:
-            obj: 変換対象のオブジェクト
-            
+            compose: generate_composeで生成した内容
+
         Returns:
-            Any: 変換後のオブジェクト
+            str: YAML形式の文字列
+        """
+        out = []
+        for key, value in compose.items():
+            self._emit_node(out, key, value, 0)
+        return ''.join(out)
+
+    def _emit_node(self, out: List[str], key: str, value: Any, indent: int) -> None:
         """
-        if isinstance(obj, OrderedDict):
-            return {k: self._to_dict(v) for k, v in obj.items()}
-        elif isinstance(obj, dict):
-            return {k: self._to_dict(v) for k, v in obj.items()}
-        elif isinstance(obj, list):
-            return [self._to_dict(i) for i in obj]
+        キーと値をブロック形式のYAMLとして書き出す
+
+        Args:
+            out: 書き出し先のリスト
+            key: キー
+            value: 値（スカラー、スカラーのリスト、または辞書）
+            indent: インデント幅
+        """
+        pad = ' ' * indent
+        key = self._yaml_scalar(key)
+        if isinstance(value, dict):
+            if not value:
+                out.append(f"{pad}{key}: {{}}\n")
+                return
+            out.append(f"{pad}{key}:\n")
+            for k, v in value.items():
+                self._emit_node(out, k, v, indent + 2)
+        elif isinstance(value, list):
+            if not value:
+                out.append(f"{pad}{key}: []\n")
+                return
+            out.append(f"{pad}{key}:\n")
+            for item in value:
+                out.append(f"{pad}  - {self._yaml_scalar(item)}\n")
         else:
-            return obj
+            out.append(f"{pad}{key}: {self._yaml_scalar(value)}\n")
 
-    def _normalize_content(self, content: str) -> str:
+    def _yaml_scalar(self, value: Union[str, int, bool, None]) -> str:
         """
-        Dockerfileの内容を正規化する
-        
+        スカラー値をYAML表記に変換する
+
+        文字列は別の型として読み込まれない場合のみ引用符なしで書き出す。
+
         Args:
-            content: 正規化対象の文字列
-            
+            value: 変換対象の値
+
         Returns:
-            str: 正規化後の文字列
+            str: YAML表記の文字列
         """
-        lines = content.splitlines()
-        normalized_lines = []
-        continuation = ''
+        if value is None:
+            return 'null'
+        if isinstance(value, bool):
+            return 'true' if value else 'false'
+        if isinstance(value, int):
+            return str(value)
+        if (_PLAIN_SCALAR_RE.fullmatch(value)
+                and _YAML_RESOLVER.resolve(yaml.ScalarNode, value, (True, False)) == _YAML_STR_TAG):
+            return value
+        quoted = json.dumps(value, ensure_ascii=False)
+        return _NON_PRINTABLE_RE.sub(lambda m: f"\\u{ord(m.group()):04x}", quoted)
+
+    def _parse_lines(self, lines: Iterable[str]) -> None:
+        """
+        Dockerfileの各行を解析し、設定を更新する
+
+        Args:
+            lines: Dockerfileの物理行
+        """
+        # 解析結果を初期化
+        self.config = DockerfileConfig()
+
+        # 論理行ごとに先頭の命令名で振り分ける
+        for line in self._logical_lines(lines):
+            # 空行・コメント・対応しない命令の行は分割する前に読み飛ばす
+            if line[:1] not in self._HANDLED_INITIALS:
+                continue
+            parts = line.split(None, 1)
+            if len(parts) < 2:
+                continue
+            token = parts[0]
+            if token not in _DIRECTIVES:
+                token = token.upper()
+            handler = self._HANDLERS.get(token)
+            if handler:
+                handler(self, parts[1])
+
+    def _logical_lines(self, lines: Iterable[str]) -> Iterator[str]:
+        """
+        行継続（末尾のバックスラッシュ）を結合した論理行を順に返す
+
+        Args:
+            lines: Dockerfileの物理行
+
+        Yields:
+            str: 前後の空白を除去した論理行（以降の処理で再度stripする必要はない）
+        """
+        buf = []
         for line in lines:
             striped = line.strip()
+            # 行継続の途中にあるコメント行と空行は無視する（Dockerの挙動に合わせる）
+            if buf and (not striped or striped.startswith('#')):
+                continue
             if striped.endswith('\\'):
-                continuation += striped[:-1] + ' '
+                buf.append(striped[:-1])
             else:
-                normalized_lines.append(continuation + striped)
-                continuation = ''
-        if continuation:
-            normalized_lines.append(continuation)
-        return '\n'.join(normalized_lines)
+                buf.append(striped)
+                yield ' '.join(buf)
+                buf = []
+        # ファイル末尾が行継続で終わる場合も末尾の空白を除去する
+        if buf:
+            yield ' '.join(buf).rstrip()
 
-    def _extract_from(self, content: str) -> None:
+    def _extract_from(self, args: str) -> None:
         """FROM命令を抽出する"""
-        m = re.search(r'^FROM\s+([\w\-.:/]+)', content, re.MULTILINE)
+        if self.config.base_image is not None:
+            return
+        m = _FROM_RE.match(args)
         if m:
             self.config.base_image = m.group(1)
 
-    def _extract_expose(self, content: str) -> None:
+    def _extract_expose(self, args: str) -> None:
         """EXPOSE命令を抽出する"""
-        self.config.ports = []
-        for m in re.finditer(r'^EXPOSE\s+([0-9]+)(?:/(tcp|udp))?', content, re.MULTILINE):
+        m = _EXPOSE_RE.match(args)
+        if m:
             port = m.group(1)
             proto = m.group(2) or 'tcp'
             if proto == 'tcp':
@@ -196,103 +370,171 @@ class DockerfileParser:
             else:
                 self.config.ports.append(f"{port}:{port}/{proto}")
 
-    def _extract_volume(self, content: str) -> None:
+    def _extract_volume(self, args: str) -> None:
         """VOLUME命令を抽出する"""
-        self.config.volumes = []
-        for m in re.finditer(r'^VOLUME\s+(.+)', content, re.MULTILINE):
-            vols = m.group(1).strip()
-            if vols.startswith('['):
-                try:
-                    vlist = json.loads(vols.replace("'", '"'))
-                    self.config.volumes.extend([f"{v}:{v}" for v in vlist])
-                except json.JSONDecodeError:
-                    pass
-            else:
-                vlist = [v.strip(' "\'') for v in vols.split()]
-                self.config.volumes.extend([f"{v}:{v}" for v in vlist])
+        vlist = self._parse_exec_form(args)
+        if vlist is None:
+            if args.startswith('['):
+                return
+            vlist = [v.strip(' "\'') for v in args.split()]
+        self.config.volumes.extend([f"{v}:{v}" for v in vlist])
 
-    def _extract_env(self, content: str) -> None:
+    def _extract_env(self, args: str) -> None:
         """ENV命令を抽出する"""
-        self.config.environment = OrderedDict()
-        for m in re.finditer(r'^ENV\s+([^\s=]+)=([^\n]+)', content, re.MULTILINE):
-            key = m.group(1).strip()
-            val = m.group(2).strip()
+        key, sep, val = args.partition('=')
+        val = val.lstrip()
+        if sep and key and val and not any(c.isspace() for c in key):
             self.config.environment[key] = val
 
-    def _extract_entrypoint(self, content: str) -> None:
+    def _extract_entrypoint(self, args: str) -> None:
         """ENTRYPOINT命令を抽出する"""
-        m = re.search(r'^ENTRYPOINT\s+\[(.+?)\]', content, re.MULTILINE)
-        if m:
-            self.config.entrypoint = [x.strip(' "\'') for x in m.group(1).split(',')]
-        else:
-            self.config.entrypoint = None
+        if self.config.entrypoint is not None:
+            return
+        self.config.entrypoint = self._parse_exec_form(args)
 
-    def _extract_cmd(self, content: str) -> None:
+    def _extract_cmd(self, args: str) -> None:
         """CMD命令を抽出する"""
-        m = re.search(r'^CMD\s+\[(.+?)\]', content, re.MULTILINE)
-        if m:
-            self.config.command = [x.strip(' "\'') for x in m.group(1).split(',')]
-        else:
-            self.config.command = None
+        if self.config.command is not None:
+            return
+        self.config.command = self._parse_exec_form(args)
 
-    def _extract_user(self, content: str) -> None:
+    def _parse_exec_form(self, args: str) -> Optional[List[str]]:
+        """
+        exec形式（JSON配列）の引数をリストに変換する
+
+        Args:
+            args: 命令の引数
+
+        Returns:
+            Optional[List[str]]: 引数のリスト（exec形式でない場合や空の場合はNone）
+        """
+        if not (args.startswith('[') and args.endswith(']')):
+            return None
+        try:
+            values = json.loads(args)
+        except json.JSONDecodeError:
+            # JSONとして不正な配列（単一引用符など）はシェルの規則で分割する
+            try:
+                parts = shlex.split(args[1:-1])
+            except ValueError:
+                return None
+            values = [p.strip(' ,') for p in parts]
+            return [v for v in values if v] or None
+        if isinstance(values, list) and all(isinstance(v, str) for v in values):
+            return values or None
+        return None
+
+    def _extract_user(self, args: str) -> None:
         """USER命令を抽出する"""
-        m = re.search(r'^USER\s+([\w\-]+)', content, re.MULTILINE)
-        if m:
-            self.config.user = m.group(1)
-        else:
-            self.config.user = None
+        if self.config.user is not None:
+            return
+        self.config.user = args.split(None, 1)[0]
 
-    def _extract_healthcheck(self, content: str) -> None:
+    def _extract_healthcheck(self, args: str) -> None:
         """HEALTHCHECK命令を抽出する"""
-        m = re.search(r'^HEALTHCHECK\s+(.+)', content, re.MULTILINE)
-        if m:
-            line = m.group(1)
-            opt_cmd = re.match(r'(.*)CMD\s+(.+)', line)
-            if opt_cmd:
-                options_str = opt_cmd.group(1)
-                cmd_str = opt_cmd.group(2)
-                interval = re.search(r'--interval=(\S+)', options_str)
-                timeout = re.search(r'--timeout=(\S+)', options_str)
-                start_period = re.search(r'--start-period=(\S+)', options_str)
-                retries = re.search(r'--retries=(\d+)', options_str)
-                cmd = shlex.split(cmd_str)
-                self.config.healthcheck = {
-                    'test': ['CMD'] + cmd,
-                    'interval': interval.group(1) if interval else '30s',
-                    'timeout': timeout.group(1) if timeout else '10s',
-                    'retries': int(retries.group(1)) if retries else 3,
-                    'start_period': start_period.group(1) if start_period else '0s'
-                }
-            else:
-                self.config.healthcheck = None
-        else:
-            self.config.healthcheck = None
+        if self.config.healthcheck is not None:
+            return
+        # CMDより前をオプション、後をヘルスチェックのコマンドとして分ける
+        options = []
+        rest = args
+        while True:
+            parts = rest.split(None, 1)
+            if len(parts) < 2:
+                return
+            if parts[0].upper() == 'CMD':
+                break
+            options.append(parts[0])
+            rest = parts[1]
 
-    def _extract_workdir(self, content: str) -> None:
+        healthcheck = {
+            'test': ['CMD'] + shlex.split(parts[1]),
+            'interval': '30s',
+            'timeout': '10s',
+            'retries': 3,
+            'start_period': '0s'
+        }
+        for opt in options:
+            key, _, value = opt.partition('=')
+            if not value:
+                continue
+            if key == '--retries':
+                if value.isdecimal():
+                    healthcheck['retries'] = int(value)
+            elif key in _HEALTHCHECK_OPTIONS:
+                healthcheck[_HEALTHCHECK_OPTIONS[key]] = value
+        self.config.healthcheck = healthcheck
+
+    def _extract_workdir(self, args: str) -> None:
         """WORKDIR命令を抽出する"""
-        m = re.search(r'^WORKDIR\s+(.+)', content, re.MULTILINE)
-        if m:
-            self.config.working_dir = m.group(1).strip()
-        else:
-            self.config.working_dir = None
+        if self.config.working_dir is None:
+            self.config.working_dir = args
+
+    # 命令名と抽出メソッドの対応表
+    _HANDLERS = {
+        'FROM': _extract_from,
+        'EXPOSE': _extract_expose,
+        'VOLUME': _extract_volume,
+        'ENV': _extract_env,
+        'ENTRYPOINT': _extract_entrypoint,
+        'CMD': _extract_cmd,
+        'USER': _extract_user,
+        'HEALTHCHECK': _extract_healthcheck,
+        'WORKDIR': _extract_workdir,
+    }
+
+    # 対応する命令の頭文字（大文字・小文字）
+    _HANDLED_INITIALS = frozenset(c for name in _HANDLERS for c in (name[0], name[0].lower()))
+
+def _cache_dir() -> Path:
+    """
+    生成結果キャッシュの保存先を返す
+
+    Raises:
+        RuntimeError: XDG_CACHE_HOMEが未設定でホームディレクトリが分からない場合
+    """
+    return Path(os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache') / 'docker-compose-generator'
 
 def main() -> None:
     """メイン関数"""
-    if len(sys.argv) < 2:
-        print("Usage: python main.py <dockerfile_path> [output_path]")
+    args = sys.argv[1:]
+    batch = '--batch' in args
+    if batch:
+        args.remove('--batch')
+    use_cache = '--no-cache' not in args
+    if not use_cache:
+        args.remove('--no-cache')
+    if len(args) < 1 or (batch and len(args) > 1):
+        print("Usage: python main.py [--no-cache] <dockerfile_path> [output_path]")
+        print("       python main.py [--no-cache] --batch <directory>")
         sys.exit(1)
 
-    dockerfile_path = sys.argv[1]
+    if batch:
+        # ディレクトリ配下のDockerfileをまとめて処理し、それぞれの隣に出力
+        directory = Path(args[0])
+        if not directory.is_dir():
+            print(f"Error: Directory not found: {directory}")
+            sys.exit(1)
+        failed = False
+        for dockerfile_path in sorted(directory.glob('**/Dockerfile')):
+            try:
+                compose_yaml = DockerfileParser.parse_cached(dockerfile_path, use_cache)
+                with open(dockerfile_path.parent / 'docker-compose.yml', 'w', encoding='utf-8') as f:
+                    f.write(compose_yaml)
+            except Exception as e:
+                print(f"Error: {dockerfile_path}: {str(e)}")
+                failed = True
+        if failed:
+            sys.exit(1)
+        return
+
+    dockerfile_path = args[0]
     # 出力先が指定されていない場合は、Dockerfileと同じディレクトリに出力
-    output_path = sys.argv[2] if len(sys.argv) > 2 else str(Path(dockerfile_path).parent / 'docker-compose.yml')
+    output_path = args[1] if len(args) > 1 else str(Path(dockerfile_path).parent / 'docker-compose.yml')
 
     try:
-        parser = DockerfileParser(dockerfile_path)
-        parser.parse()
-        compose_yaml = parser.generate_compose_yaml()
+        compose_yaml = DockerfileParser.parse_cached(dockerfile_path, use_cache)
 
-        with open(output_path, 'w') as f:
+        with open(output_path, 'w', encoding='utf-8') as f:
             f.write(compose_yaml)
 
     except Exception as e:
@@ -2,48 +2,28 @@
 import os
 import sys
 import yaml
+import shutil
 import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-def normalize_value(v):
-    """値を正規化して比較可能な形式に変換"""
-    if isinstance(v, (int, float, bool)):
-        return str(v)
-    elif isinstance(v, str):
-        return v.strip()
-    elif isinstance(v, (list, tuple)):
-        return [normalize_value(x) for x in v]
-    elif isinstance(v, dict):
-        return {k: normalize_value(v) for k, v in v.items()}
-    return v
-
-def deep_equal(a, b):
-    """本質的な差がない場合はTrueを返す比較関数"""
-    # 値を正規化
-    a_norm = normalize_value(a)
-    b_norm = normalize_value(b)
-    
-    # 辞書の場合
-    if isinstance(a_norm, dict) and isinstance(b_norm, dict):
-        if set(a_norm.keys()) != set(b_norm.keys()):
-            return False
-        return all(deep_equal(a_norm[k], b_norm[k]) for k in a_norm)
-    
-    # リストの場合
-    elif isinstance(a_norm, list) and isinstance(b_norm, list):
-        if len(a_norm) != len(b_norm):
-            return False
-        # リストの要素を正規化して比較
-        a_sorted = sorted(str(x) for x in a_norm)
-        b_sorted = sorted(str(x) for x in b_norm)
-        return a_sorted == b_sorted
-    
-    # その他の場合
-    else:
-        # 文字列化して比較し、空白や改行の違いを吸収
-        a_str = str(a_norm).strip().replace('\n', ' ').replace('  ', ' ')
-        b_str = str(b_norm).strip().replace('\n', ' ').replace('  ', ' ')
-        return a_str == b_str
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+from main import DockerfileParser
+
+try:
+    from yaml import CSafeLoader as _Loader, CSafeDumper as _Dumper
+except ImportError:
+    from yaml import SafeLoader as _Loader, SafeDumper as _Dumper
+
+def canon(o):
+    """比較用に正規化する（リストの順序は無視する）"""
+    if isinstance(o, list):
+        return sorted((canon(x) for x in o), key=str)
+    if isinstance(o, dict):
+        return {k: canon(v) for k, v in o.items()}
+    return o
 
 def run_test(test_dir):
     print(f"\nTesting {test_dir}...")
@@ -52,36 +32,40 @@ def run_test(test_dir):
     test_name = os.path.basename(test_dir)
     
     # Generate docker-compose.yml
-    result = subprocess.run(
-        [sys.executable, "main.py", f"{test_dir}/Dockerfile", f"{test_dir}/docker-compose.yml"],
-        capture_output=True,
-        text=True
-    )
-    
-    if result.returncode != 0:
+    try:
+        parser = DockerfileParser(f"{test_dir}/Dockerfile")
+        parser.parse()
+        with open(f"{test_dir}/docker-compose.yml", 'w') as f:
+            f.write(parser.generate_compose_yaml())
+    except Exception as e:
         print(f"Error generating docker-compose.yml for {test_name}:")
-        print(result.stderr)
+        print(str(e))
         return False
     
     # Compare with expected output
+    return compare_compose(test_dir, f"{test_dir}/docker-compose.yml")
+
+def compare_compose(test_dir, generated_path):
+    """生成されたdocker-compose.ymlをテストディレクトリの期待値と比較する"""
+    test_name = os.path.basename(test_dir)
     try:
-        with open(f"{test_dir}/docker-compose.yml", 'r') as f:
-            generated = yaml.safe_load(f)
+        with open(generated_path, 'r') as f:
+            generated = yaml.load(f, Loader=_Loader)
         
         with open(f"{test_dir}/expected_compose.yml", 'r') as f:
-            expected = yaml.safe_load(f)
+            expected = yaml.load(f, Loader=_Loader)
         
         # 本質的な差がない場合はpass
-        if deep_equal(generated, expected):
+        if canon(generated) == canon(expected):
             print(f"✅ {test_name} passed")
             return True
         
         # 差分を表示
         print(f"❌ {test_name} failed")
         print("Generated:")
-        print(yaml.dump(generated))
+        print(yaml.dump(generated, Dumper=_Dumper, default_flow_style=False, sort_keys=False))
         print("Expected:")
-        print(yaml.dump(expected))
+        print(yaml.dump(expected, Dumper=_Dumper, default_flow_style=False, sort_keys=False))
         
         # 差分の詳細を表示
         print("\nDifferences:")
@@ -101,14 +85,96 @@ def run_test(test_dir):
         print(f"Error comparing files for {test_name}: {str(e)}")
         return False
 
+def run_cache_test():
+    """main.py経由で生成し、キャッシュのミスとヒットを確認する"""
+    print("\nTesting main.py with cache...")
+    test_dir = ROOT_DIR / "test" / "test_basic"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, XDG_CACHE_HOME=tmp)
+        env.pop("DOCKER_COMPOSE_GENERATOR_NO_CACHE", None)
+        cache_dir = Path(tmp) / "docker-compose-generator"
+        output = Path(tmp) / "docker-compose.yml"
+
+        def generate():
+            return subprocess.run(
+                [sys.executable, str(ROOT_DIR / "main.py"), str(test_dir / "Dockerfile"), str(output)],
+                capture_output=True,
+                text=True,
+                env=env
+            )
+
+        # キャッシュミス: 生成結果が期待値と一致し、キャッシュに保存される
+        result = generate()
+        if result.returncode != 0:
+            print(f"❌ cache miss failed: {result.stdout}{result.stderr}")
+            return False
+        entries = list(cache_dir.glob("*.yml"))
+        if len(entries) != 1 or entries[0].read_text() != output.read_text():
+            print(f"❌ cache miss did not store the generated file: {entries}")
+            return False
+        if not compare_compose(str(test_dir), str(output)):
+            return False
+
+        # キャッシュヒット: キャッシュの内容がそのまま出力される
+        entries[0].write_text("cached: true\n")
+        result = generate()
+        if result.returncode != 0 or output.read_text() != "cached: true\n":
+            print(f"❌ cache hit did not return the cached file: {result.stdout}{result.stderr}")
+            return False
+
+    print("✅ cache passed")
+    return True
+
+def run_batch_test(test_dirs):
+    """--batchで全テストケースをまとめて生成し、失敗したDockerfileがあっても残りを処理することを確認する"""
+    print("\nTesting main.py --batch...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        projects = Path(tmp) / "projects"
+        # 個別テストで生成済みのdocker-compose.ymlはコピーしない
+        for test_dir in test_dirs:
+            shutil.copytree(test_dir, projects / test_dir.name, ignore=shutil.ignore_patterns("docker-compose.yml"))
+        # UTF-8として読めないDockerfile（名前順で最初に処理される）
+        broken = projects / "broken"
+        broken.mkdir()
+        (broken / "Dockerfile").write_bytes(b"FROM alpine\n\xff\xfe\n")
+
+        result = subprocess.run(
+            [sys.executable, str(ROOT_DIR / "main.py"), "--no-cache", "--batch", str(projects)],
+            capture_output=True,
+            text=True,
+            env=dict(os.environ, XDG_CACHE_HOME=tmp)
+        )
+        if result.returncode != 1 or str(broken / "Dockerfile") not in result.stdout:
+            print(f"❌ batch did not report the broken Dockerfile (exit {result.returncode}): {result.stdout}{result.stderr}")
+            return False
+        if (broken / "docker-compose.yml").exists():
+            print("❌ batch wrote a docker-compose.yml for the broken Dockerfile")
+            return False
+
+        ok = True
+        for test_dir in test_dirs:
+            generated = projects / test_dir.name / "docker-compose.yml"
+            if not generated.exists():
+                print(f"❌ batch did not generate {generated}")
+                ok = False
+            elif not compare_compose(str(projects / test_dir.name), str(generated)):
+                ok = False
+
+    if ok:
+        print("✅ batch passed")
+    return ok
+
 def main():
     # Get all test directories
     test_dirs = [d for d in Path("test").iterdir() if d.is_dir() and d.name.startswith("test_")]
     
-    # Run tests
-    results = []
-    for test_dir in test_dirs:
-        results.append(run_test(str(test_dir)))
+    # Run tests (each test directory is independent, so run them in parallel)
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+        results = list(ex.map(run_test, map(str, test_dirs)))
+    results.append(run_cache_test())
+    results.append(run_batch_test(test_dirs))
     
     # Print summary
     print("\nTest Summary:")